@@ -102,6 +102,10 @@ class COMFrame(object):
         time (float): The simulation time that this Frame represents.
         number (int): The frame number of this Frame.
         mdnumber (int): The corresponding frame number in the original MD trajectory
+        com_xyz (np.array): A (nlipids, 3) array with the wrapped coordinates of
+            the LipidCOM objects, in the same order as lipidcom.
+        com_unwrap_xyz (np.array): A (nlipids, 3) array with the unwrapped
+            coordinates of the LipidCOM objects, in the same order as lipidcom.
 
 
     """
@@ -146,6 +150,16 @@ class COMFrame(object):
 
         return
 
+    # contiguous copies of the LipidCOM coordinates for vectorized access;
+    # built from lipidcom on each access so they never go stale
+    @property
+    def com_xyz(self):
+        return np.array([lipid.com for lipid in self.lipidcom]).reshape(-1, 3)
+
+    @property
+    def com_unwrap_xyz(self):
+        return np.array([lipid.com_unwrap for lipid in self.lipidcom]).reshape(-1, 3)
+
     def _build_single_bead(self, mda_frame, mda_bilayer_selection,
                            unwrap_coords, name_dict=None):
         nlipids = len(mda_bilayer_selection.residues)
@@ -18,9 +18,36 @@ from __future__ import print_function
 from builtins import object
 from six.moves import range
 import numpy as np
+import scipy
 from scipy.ndimage.filters import gaussian_filter
-# pybilt imports
-from pybilt.common.running_stats import RunningStats
+from scipy.spatial import cKDTree
+# SciPy 1.6 renamed the n_jobs option of cKDTree.query to workers
+_scipy_version = tuple(int(v) for v in scipy.__version__.split('.')[:2])
+if _scipy_version >= (1, 6):
+    _QUERY_WORKERS = 'workers'
+else:
+    _QUERY_WORKERS = 'n_jobs'
+# concurrent.futures needs the futures backport on Python 2.7; without it
+# the leaflets are always processed in turn
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+def _mean_and_deviation(values):
+    """Mean and standard deviation of an array of values.
+
+    Matches the RunningStats conventions: the standard deviation uses the
+    n-1 normalization and both values default to 0.0 when there are not
+    enough values to compute them.
+    """
+    values = np.asarray(values)
+    n = values.size
+    if n == 0:
+        return (0.0, 0.0)
+    elif n == 1:
+        return (values.mean(), 0.0)
+    return (values.mean(), values.std(ddof=1))
 
 def grid_curvature(x_vals, y_vals, zgrid):
     """Compute the Mean and Gaussian curvature across a grid.
@@ -33,49 +60,59 @@ def grid_curvature(x_vals, y_vals, zgrid):
         tuple: Returns a 2 item tuple with the 2d numpy arrays of the curvatures with
             format (mean curvature, Gaussian curvature).
     """
-    nxb = len(x_vals)
-    nyb = len(y_vals)
     x_incr = x_vals[1]-x_vals[0]
     y_incr = y_vals[1]-y_vals[0]
     # print("x_incr {} y_incr {}".format(x_incr, y_incr))
     [sy, sx] = np.gradient(zgrid, y_incr, x_incr)
-    [syy, syx] = np.gradient(sy, y_incr, x_incr)
+    # only the second derivatives used below; syx is not needed
+    syy = np.gradient(sy, y_incr, axis=0)
     [sxy, sxx] = np.gradient(sx, y_incr, x_incr)
     #now get curvatures
-    curv_mean_u = np.zeros((nxb, nyb))
-    curv_gauss_u = np.zeros((nxb, nyb))
-    for ix in range(nxb):
-        for iy in range(nyb):
-            #upper
-            sx_c = sx[ix, iy]
-            sy_c = sy[ix, iy]
-            ssx = sxx[ix, iy]
-            ssy = syy[ix, iy]
-            ssxy = sxy[ix, iy]
-            sx_v = np.array([x_incr, 0.0, sx_c])
-            sy_v = np.array([0.0, y_incr, sy_c])
-            ssx_v = np.array([x_incr, 0.0, ssx])
-            ssy_v = np.array([0.0, y_incr, ssy])
-            ssxy_v = np.array([0.0, y_incr, ssxy])
-            E = np.dot(sx_v, sx_v)
-            F = np.dot(sx_v, sy_v)
-            G = np.dot(sy_v, sy_v)
-            n = np.cross(sx_v, sy_v)
-            n /=np.linalg.norm(n)
-            L = np.dot(ssx_v, n)
-            M = np.dot(ssxy_v, n)
-            N = np.dot(ssy_v, n)
-            #mean curvature
-            J = (E*N+G*L-2.0*F*M)/(2.0*(E*G-F)**2)
-            #Gaussian curvature
-            K = (L*N-M**2)/(E*G-F**2)
-            curv_mean_u[ix, iy] = J
-            curv_gauss_u[ix, iy] = K
-            # print("ix: {} iy: {} J: {} K: {}".format(ix,iy,J,K))
-
+    # The tangent vectors at each grid point are sx_v = (x_incr, 0, sx) and
+    # sy_v = (0, y_incr, sy), so the dot and cross products reduce to
+    # elementwise expressions over the whole grid.
+    xy_incr = x_incr*y_incr
+    # first fundamental form -- E = sx_v.sx_v, F = sx_v.sy_v, G = sy_v.sy_v
+    E = x_incr**2 + sx*sx
+    F = sx*sy
+    G = y_incr**2 + sy*sy
+    # unit normal n = (sx_v x sy_v)/|sx_v x sy_v|, with
+    # sx_v x sy_v = (-y_incr*sx, -x_incr*sy, x_incr*y_incr)
+    n_norm = np.sqrt((y_incr*sx)**2 + (x_incr*sy)**2 + xy_incr**2)
+    # second fundamental form -- projections of (x_incr, 0, sxx),
+    # (0, y_incr, sxy), and (0, y_incr, syy) onto the unit normal
+    L = xy_incr*(sxx - sx)/n_norm
+    M = xy_incr*(sxy - sy)/n_norm
+    N = xy_incr*(syy - sy)/n_norm
+    #mean curvature
+    curv_mean_u = (E*N+G*L-2.0*F*M)/(2.0*(E*G-F)**2)
+    #Gaussian curvature
+    curv_gauss_u = (L*N-M**2)/(E*G-F**2)
 
     return (curv_mean_u, curv_gauss_u)
 
+def _map_lipid_values(lipid_grid, lipid_values, dtype=None):
+    """Map a set of per-lipid values onto a lipid grid.
+
+    Args:
+        lipid_grid (np.array): A grid (or flattened grid) of COMFrame lipid
+            indices.
+        lipid_values (dict): The values keyed by COMFrame lipid index. It must
+            have an entry for every lipid in lipid_grid.
+        dtype (Optional[np.dtype]): The data type of the output grid.
+            Defaults to None, in which case it is inferred from the values.
+
+    Returns:
+        np.array: An array with the same shape as lipid_grid that holds the
+            value of the lipid assigned to each grid point. Vector values add
+            a trailing dimension.
+    """
+    # look up the value of each unique lipid once and then scatter the
+    # values back onto the grid
+    com_inds, grid_map = np.unique(lipid_grid, return_inverse=True)
+    values = np.array([lipid_values[ic] for ic in com_inds], dtype=dtype)
+    return values[grid_map.reshape(lipid_grid.shape)]
+
 def grid_surface_area(x_vals, y_vals, zgrid):
     """Compute the surface area across a regular 2d grid.
     Args:
@@ -86,26 +123,81 @@ def grid_surface_area(x_vals, y_vals, zgrid):
     Returns:
         float: Returns a the surface area estimate.
     """
-    nxb = len(x_vals)
-    nyb = len(y_vals)
     x_incr = x_vals[1]-x_vals[0]
     y_incr = y_vals[1]-y_vals[0]
     # print("x_incr {} y_incr {}".format(x_incr, y_incr))
     [sy, sx] = np.gradient(zgrid, y_incr, x_incr)
-    #now get curvatures
-    sa = 0.0
-    for ix in range(nxb):
-        for iy in range(nyb):
-            #upper
-            sx_c = sx[ix, iy]
-            sy_c = sy[ix, iy]
-            sx_v = np.array([1.0, 0.0, sx_c])
-            sy_v = np.array([0.0, 1.0, sy_c])
-            cross = np.cross(sx_v, sy_v)
-            dA = np.sqrt(np.dot(cross, cross))*x_incr*y_incr
-            sa += dA
+    # the tangent vectors at each grid point are sx_v = (1, 0, sx) and
+    # sy_v = (0, 1, sy), so |sx_v x sy_v| = |(-sx, -sy, 1)| and the area
+    # elements can be summed over the whole grid at once
+    dA = np.sqrt(1.0 + sx*sx + sy*sy)*x_incr*y_incr
+    sa = dA.sum()
     return sa
 
+def _assign_lipids(x_centers, y_centers, xi, yi, zi, indices, boxx, boxy,
+                   lipid_grid, lipid_grid_z, workers=1):
+    """Assign the nearest lipid to each grid point using a periodic KD-tree.
+
+    Args:
+        x_centers (np.array): The grid point positions along 'x'.
+        y_centers (np.array): The grid point positions along 'y'.
+        xi (np.array): The lipid 'x' coordinates.
+        yi (np.array): The lipid 'y' coordinates.
+        zi (np.array): The lipid 'z' coordinates.
+        indices (np.array): The COMFrame indices of the lipids.
+        boxx (float): The box length along 'x'.
+        boxy (float): The box length along 'y'.
+        lipid_grid (np.array): The 2d array to fill with the index of the
+            lipid assigned to each grid point.
+        lipid_grid_z (np.array): The 2d array to fill with the 'z'
+            coordinate of the lipid assigned to each grid point.
+        workers (Optional[int]): The number of native threads to split the
+            KD-tree query over; -1 uses all of the available cores. Defaults
+            to 1.
+    """
+    # an empty leaflet has no lipids to assign
+    if len(indices) == 0:
+        lipid_grid[:, :] = 0
+        lipid_grid_z[:, :] = 0.0
+        return
+    # the periodic tree needs the COMs inside [0, box); values that round
+    # to the box length itself are wrapped to zero
+    coms = np.column_stack((xi - boxx*np.floor(xi/boxx),
+                            yi - boxy*np.floor(yi/boxy)))
+    coms[coms[:, 0] >= boxx, 0] = 0.0
+    coms[coms[:, 1] >= boxy, 1] = 0.0
+    tree = cKDTree(coms, boxsize=[boxx, boxy])
+    #get the grid points
+    nx = len(x_centers)
+    ny = len(y_centers)
+    grid_points = np.empty((nx, ny, 2))
+    grid_points[:, :, 0] = x_centers[:, None]
+    grid_points[:, :, 1] = y_centers[None, :]
+    grid_points = grid_points.reshape(-1, 2)
+    # assign the nearest lipid to each grid point
+    k_min = tree.query(grid_points, **{_QUERY_WORKERS: workers})[1]
+    k_min = k_min.reshape(lipid_grid.shape)
+    lipid_grid[:, :] = indices[k_min]
+    lipid_grid_z[:, :] = zi[k_min]
+    return
+
+def _leaflet_map(func, leaves, threaded=False):
+    """Apply func to each leaflet key, optionally in concurrent threads.
+
+    Args:
+        func (callable): Function taking a leaflet key.
+        leaves (list): The leaflet keys, e.g. ['upper', 'lower'].
+        threaded (Optional[bool]): Run each leaflet in its own thread when
+            concurrent.futures is available. Defaults to False.
+
+    Returns:
+        list: The return values of func, in the order of leaves.
+    """
+    if not threaded or ThreadPoolExecutor is None:
+        return [func(leaf) for leaf in leaves]
+    with ThreadPoolExecutor(max_workers=len(leaves)) as executor:
+        return list(executor.map(func, leaves))
+
 class LipidGrid2d(object):
     """A 2d lipid grid object.
 
@@ -148,7 +240,7 @@ class LipidGrid2d(object):
 
     """
     def __init__(self, com_frame, com_frame_indices, plane, nxbins=50,
-                 nybins=50):
+                 nybins=50, com_xy=None, com_z=None, workers=1):
         """Initialize the LipidGrid2d object.
 
         Args:
@@ -164,6 +256,15 @@ class LipidGrid2d(object):
             nybins (Optional[int): The number of bins along the 'y'
                 dimension, i.e. along the dimension corresponding to
                 plane[1]. Defaults to 50.
+            com_xy (Optional[np.array]): The lateral (plane) coordinates of
+                all the lipid COMs in com_frame, shape (nlipids, 2). Defaults
+                to None, in which case they are sliced from com_frame.
+            com_z (Optional[np.array]): The unwrapped normal coordinates of
+                all the lipid COMs in com_frame. Defaults to None, in which
+                case they are sliced from com_frame.
+            workers (Optional[int]): The number of native threads used for
+                the nearest lipid search; -1 uses all of the available cores.
+                Defaults to 1.
         """
         # store the frame and leaflet
         self.frame = com_frame
@@ -179,7 +280,8 @@ class LipidGrid2d(object):
         # save the numbers of bins
         self.x_nbins = nxbins
         self.y_nbins = nybins
-        # initialize the edges of the and centers of the gridpoints
+        # initialize the edges of the and centers of the gridpoints; the
+        # centers are kept in float64 even when the box is float32
         # x
         self.x_min = 0.0
         self.x_max = boxx
@@ -187,11 +289,8 @@ class LipidGrid2d(object):
                                    endpoint=True)
         self.x_incr = self.x_edges[1] - self.x_edges[0]
         x_incr_h = self.x_incr / 2.0
-        self.x_centers = np.zeros(nxbins)
+        self.x_centers = (self.x_edges[:-1] + x_incr_h).astype(np.float64)
         self._x_nedges = len(self.x_edges)
-        for i in range(1, self._x_nedges):
-            j = i-1
-            self.x_centers[j] = self.x_edges[j] + x_incr_h
 
         # y
         self.y_min = 0.0
@@ -200,52 +299,27 @@ class LipidGrid2d(object):
                                    endpoint=True)
         self.y_incr = self.y_edges[1] - self.y_edges[0]
         y_incr_h = self.y_incr / 2.0
-        self.y_centers = np.zeros(nybins)
+        self.y_centers = (self.y_edges[:-1] + y_incr_h).astype(np.float64)
         self.y_nedges = len(self.y_edges)
-        for i in range(1, self._x_nedges):
-            j = i - 1
-            self.y_centers[j] = self.y_edges[j] + y_incr_h
         self.x_length = self.x_max - self.x_min
         self.y_length = self.y_max - self.y_min
         # get the lipid indices for this leaflet
         indices = com_frame_indices
         # now assign lipids to the gridpoints
-        self.lipid_grid = np.zeros((nxbins, nybins), dtype=np.int)
+        self.lipid_grid = np.zeros((nxbins, nybins), dtype=np.int32)
         self.lipid_grid_z = np.zeros((nxbins, nybins))
-        bxh = boxx / 2.0
-        byh = boxy / 2.0
-        cx = 0
-        for x in self.x_centers:
-            cy = 0
-            for y in self.y_centers:
-                r_min = 1.0e10
-                i_min = 0
-                z_min = 0.0
-                #check lipid COMs
-                for i in indices:
-                    xi = com_frame.lipidcom[i].com[ix]
-                    yi = com_frame.lipidcom[i].com[iy]
-                    zi = com_frame.lipidcom[i].com_unwrap[iz]
-                    #print "iz ",iz," zi ",zi
-                    dx = x - xi
-                    dy = y - yi
-                    #Minimum image -- coordinates must be pre-wrapped
-                    if np.absolute(dx) > bxh:
-                        dx = boxx - np.absolute(x - bxh) - np.absolute(xi -
-                                                                       bxh)
-                    if np.absolute(dy) > bxh:
-                        dy = boxy - np.absolute(y - byh) - np.absolute(yi -
-                                                                       byh)
-                    rxy = np.sqrt(dx**2 + dy**2)
-                    if rxy < r_min:
-                        r_min = rxy
-                        i_min = i
-                        z_min = zi
-
-                self.lipid_grid[cx,cy] = i_min
-                self.lipid_grid_z[cx,cy] = z_min
-                cy += 1
-            cx += 1
+        # gather the lipid COM coordinates
+        if com_xy is None:
+            com_xy = com_frame.com_xyz[:, plane]
+        if com_z is None:
+            com_z = com_frame.com_unwrap_xyz[:, iz]
+        indices = np.asarray(indices, dtype=np.intp)
+        xi = com_xy[indices, 0]
+        yi = com_xy[indices, 1]
+        zi = com_z[indices]
+        _assign_lipids(self.x_centers, self.y_centers, xi, yi, zi, indices,
+                       float(boxx), float(boxy), self.lipid_grid,
+                       self.lipid_grid_z, workers=workers)
 
     def get_index_at(self, ix, iy):
         """Returns the COMFrame index of the lipid at the specified position
@@ -301,10 +375,8 @@ class LipidGrid2d(object):
         xyz_out = open(xyz_name, "w")
         npoints = self.x_nbins*self.y_nbins
         comment = "Leaflet Grid " + self.leaflet.name
-        xyz_out.write(str(npoints))
-        xyz_out.write("\n")
-        xyz_out.write(comment)
-        xyz_out.write("\n")
+        # build the file contents up front and write them in one go
+        lines = [str(npoints), comment]
 
         cx=0
         for x in self.x_centers:
@@ -315,20 +387,18 @@ class LipidGrid2d(object):
                 #get the lipid resname
                 ic = self.lipid_grid[cx,cy]
                 oname = self.frame.lipidcom[ic].type
-                #write to file
-
-
                 line = str(oname)+" "+str(x)+" "+str(y)+" "+str(z)
-
-                xyz_out.write(line)
-                xyz_out.write("\n")
+                lines.append(line)
                 cy+=1
             cx+=1
+        lines.append("")
+        xyz_out.write("\n".join(lines))
         xyz_out.close()
         return
 
 class LipidGrids(object):
-    def __init__(self, com_frame, leaflets, plane, nxbins=50, nybins=50):
+    def __init__(self, com_frame, leaflets, plane, nxbins=50, nybins=50,
+                 threaded=False, workers=1):
         #store the frame and leaflet
         self.frame = com_frame
         self.leaflets = leaflets
@@ -338,39 +408,39 @@ class LipidGrids(object):
         self.nbins_y = nybins
         self.leaf_grid = {}
         self.myframe = com_frame.mdnumber
+        # process the two leaflets in concurrent threads; only worth it for
+        # large grids on multi-core machines
+        self.threaded = threaded and (ThreadPoolExecutor is not None)
+        # keep one level of parallelism -- with a thread per leaflet each
+        # KD-tree query runs on a single native thread
+        if self.threaded:
+            workers = 1
+        # slice out the COM coordinates once for both leaflets
+        com_xy = com_frame.com_xyz[:, plane]
+        com_z = com_frame.com_unwrap_xyz[:, self.norm]
         #initialize the grids
-        #upper
-        upper_indices = leaflets['upper'].get_member_indices()
-        self.leaf_grid['upper'] = LipidGrid2d(com_frame, upper_indices,
-                                              plane, nxbins=nxbins,
-                                              nybins=nybins)
-        #lower
-        lower_indices = leaflets['lower'].get_member_indices()
-        self.leaf_grid['lower'] = LipidGrid2d(com_frame, lower_indices,
-                                              plane, nxbins=nxbins,
-                                              nybins=nybins)
+        def leaflet_grid(leaf):
+            indices = leaflets[leaf].get_member_indices()
+            return LipidGrid2d(com_frame, indices, plane, nxbins=nxbins,
+                               nybins=nybins, com_xy=com_xy, com_z=com_z,
+                               workers=workers)
+        upper, lower = _leaflet_map(leaflet_grid, ['upper', 'lower'],
+                                    threaded=self.threaded)
+        self.leaf_grid['upper'] = upper
+        self.leaf_grid['lower'] = lower
         return
 
     def thickness_grid(self):
-        tgrid = np.zeros((self.nbins_x, self.nbins_y))
-        for ix in range(self.nbins_x):
-            for iy in range(self.nbins_y):
-                zu = self.leaf_grid['upper'].get_z_at(ix, iy)
-                zl = self.leaf_grid['lower'].get_z_at(ix, iy)
-                dz = zu - zl
-                tgrid[ix,iy] = dz
-                if dz < 0.0:
-                    print("Warning!!--MD frame number ",self.myframe," --Value thickness less than zero (",dz,") at grid point ",ix," ",iy)
+        tgrid = (self.leaf_grid['upper'].lipid_grid_z -
+                 self.leaf_grid['lower'].lipid_grid_z)
+        for ix, iy in zip(*np.where(tgrid < 0.0)):
+            dz = tgrid[ix, iy]
+            print("Warning!!--MD frame number ",self.myframe," --Value thickness less than zero (",dz,") at grid point ",ix," ",iy)
         return tgrid
 
     def average_thickness(self, return_grid=False):
-        trun = RunningStats()
         tgrid = self.thickness_grid()
-        for ix in range(self.nbins_x):
-            for iy in range(self.nbins_y):
-                tc = tgrid[ix, iy]
-                trun.push(tc)
-        avg_out = (trun.mean(), trun.deviation())
+        avg_out = _mean_and_deviation(tgrid)
         if return_grid:
             return avg_out, tgrid
         else:
@@ -392,12 +462,9 @@ class LipidGrids(object):
 
         out_dict = {}
         for leaf in do_leaflet:
-            out_dict[leaf] = np.zeros((self.nbins_x,self.nbins_y))
-            for ix in range(self.nbins_x):
-                for iy in range(self.nbins_y):
-                    com_ind=self.leaf_grid[leaf].get_index_at(ix,iy)
-                    value = com_values_dict[com_ind]
-                    out_dict[leaf][ix,iy]=value
+            out_dict[leaf] = _map_lipid_values(self.leaf_grid[leaf].lipid_grid,
+                                               com_values_dict,
+                                               dtype=np.float64)
 
         return out_dict
 
@@ -412,54 +479,46 @@ class LipidGrids(object):
                 gname = group.name()
                 if gname not in resnames:
                     resnames.append(gname)
-        #initialize counters for each residue/type
-        area_run_per_res_type = {}
-
-        for name in resnames:
-            area_run_per_res_type[name]=RunningStats()
-
         area_per_lipid = {}
-
-        area_run = RunningStats()
+        # collect the areas and types of all the lipids
+        areas = []
+        area_types = []
         for leaf in do_leaflet:
             area_per_bin = self.leaf_grid[leaf].x_incr*self.leaf_grid[leaf].y_incr
+            # number of grid points assigned to each lipid
+            nlocs = np.bincount(self.leaf_grid[leaf].lipid_grid.ravel(),
+                                minlength=len(self.frame.lipidcom))
             lip_ind = self.leaflets[leaf].get_member_indices()
             for i in lip_ind:
                 rname = self.frame.lipidcom[i].type
-                locations = np.where(self.leaf_grid[leaf].lipid_grid == i)
-                nlocs = len(locations[0])
-                #print locations
-                #print 'nlocs ',nlocs
-                area = area_per_bin*nlocs
+                area = area_per_bin*nlocs[i]
                 area_per_lipid[i]=area
-                area_run_per_res_type[rname].push(area)
-
-                area_run.push(area)
+                areas.append(area)
+                area_types.append(rname)
+        areas = np.array(areas)
+        area_types = np.array(area_types)
 
         average_per_res = {}
         for name in resnames:
-            average = area_run_per_res_type[name].mean()
-            std = area_run_per_res_type[name].deviation()
-            average_per_res[name] = (average,std)
-        system_average = area_run.mean()
-        #system_dev = area_run.deviation()
+            average_per_res[name] = _mean_and_deviation(areas[area_types == name])
+        system_average = _mean_and_deviation(areas)[0]
+        #system_dev = _mean_and_deviation(areas)[1]
 
         output = (system_average, average_per_res, area_per_lipid)
         return output
 
     def curvature(self, use_gaussian_filter=True, filter_sigma=10.0, filter_mode='nearest'):
-        x_vals = self.leaf_grid['upper'].x_centers
-        y_vals = self.leaf_grid['upper'].y_centers
-        z_grid = self.leaf_grid['upper'].lipid_grid_z
-        if use_gaussian_filter:
-            z_grid = gaussian_filter(z_grid, filter_sigma, mode=filter_mode)
-        curv_upper = grid_curvature(x_vals, y_vals, z_grid)
-        x_vals = self.leaf_grid['lower'].x_centers
-        y_vals = self.leaf_grid['lower'].y_centers
-        z_grid = self.leaf_grid['lower'].lipid_grid_z
-        if use_gaussian_filter:
-            z_grid = gaussian_filter(z_grid, filter_sigma, mode=filter_mode)
-        curv_lower = grid_curvature(x_vals, y_vals, z_grid)
+        def leaflet_curvature(leaf):
+            x_vals = self.leaf_grid[leaf].x_centers
+            y_vals = self.leaf_grid[leaf].y_centers
+            z_grid = self.leaf_grid[leaf].lipid_grid_z
+            if use_gaussian_filter:
+                z_grid = gaussian_filter(z_grid, filter_sigma,
+                                         mode=filter_mode)
+            return grid_curvature(x_vals, y_vals, z_grid)
+        curv_upper, curv_lower = _leaflet_map(leaflet_curvature,
+                                              ['upper', 'lower'],
+                                              threaded=self.threaded)
 
         return (curv_upper, curv_lower)
 
@@ -479,12 +538,9 @@ class LipidGrids(object):
         return (sa_upper, sa_lower)
 
     def grid_to_dict(self,in_grid,leaflet='upper'):
-        out_dict = {}
-        for ix in range(self.nbins_x):
-            for iy in range(self.nbins_y):
-                l_i = self.leaf_grid[leaflet].get_index_at(ix,iy)
-                grid_val = in_grid[ix,iy]
-                out_dict[l_i]=grid_val
+        l_i = self.leaf_grid[leaflet].lipid_grid.ravel()
+        grid_val = np.asarray(in_grid).ravel()
+        out_dict = dict(zip(l_i, grid_val))
         return out_dict
 
     def get_xyzc(self,leaflet='both',zvalue_dict=None,color_dict=None,color_grid=None, color_type_dict=None):
@@ -501,47 +557,30 @@ class LipidGrids(object):
             do_leaflet.append('upper')
             do_leaflet.append('lower')
         out_dict = {}
-        npoints = (self.nbins_x*self.nbins_y)
-        X = np.zeros(npoints)
-        Y = np.zeros(npoints)
-        Z = np.zeros(npoints)
-        C = np.zeros(npoints)
-        if color_dict is not None:
-            if len(color_dict.shape)==2:
-                C = np.zeros((npoints, color_dict.shape[1]))
-        if color_type_dict is not None:
-            #dict_type = type(color_type_dict[color_type_dict.keys()[0]])
-            C = list()
         for leaf in do_leaflet:
-            npt = 0
-            cx=0
-            for x in self.leaf_grid[leaf].x_centers:
-                cy=0
-                for y in self.leaf_grid[leaf].y_centers:
-                    #get the z coordinate
-                    z = self.leaf_grid[leaf].get_z_at(cx,cy)
-                    ic = self.leaf_grid[leaf].get_index_at(cx,cy)
-                    #optionally pull z value from lipid index dictionary
-                    if zvalue_dict is not None:
-                        z = zvalue_dict[ic]
-                    X[npt]=x
-                    Y[npt]=y
-                    Z[npt]=z
-                    if color_dict is not None:
-                        C[npt]=color_dict[ic]
-                    if color_grid is not None:
-                        C[npt]=color_grid[cx,cy]
-                    if color_type_dict is not None:
-                        ltype = self.frame.lipidcom[ic].type
-                        color_curr = color_type_dict[ltype]
-                        C.append(color_curr)
-
-                    npt+=1
-                    cy+=1
-                cx+=1
-
+            lipid_inds = self.leaf_grid[leaf].lipid_grid.ravel()
+            X, Y = np.meshgrid(self.leaf_grid[leaf].x_centers,
+                               self.leaf_grid[leaf].y_centers, indexing='ij')
+            X = X.ravel()
+            Y = Y.ravel()
+            #get the z coordinate
+            Z = self.leaf_grid[leaf].lipid_grid_z.flatten()
+            #optionally pull z value from lipid index dictionary
+            if zvalue_dict is not None:
+                Z = _map_lipid_values(lipid_inds, zvalue_dict,
+                                      dtype=np.float64)
+            C = np.zeros(len(lipid_inds))
+            if color_dict is not None:
+                C = np.asarray(color_dict, dtype=np.float64)[lipid_inds]
+            if color_grid is not None:
+                C = np.asarray(color_grid, dtype=np.float64).flatten()
             if color_type_dict is not None:
-                C = np.array(C)
+                #dict_type = type(color_type_dict[color_type_dict.keys()[0]])
+                lipid_colors = {}
+                for ic in self.leaflets[leaf].get_member_indices():
+                    ltype = self.frame.lipidcom[ic].type
+                    lipid_colors[ic] = color_type_dict[ltype]
+                C = _map_lipid_values(lipid_inds, lipid_colors)
             out_dict[leaf]=(X,Y,Z,C)
         return out_dict
 
@@ -566,34 +605,28 @@ class LipidGrids(object):
         xyz_out = open(out_name, "w")
         npoints = (self.nbins_x*self.nbins_y)*len(do_leaflet)
         comment = "Leaflet Grid in xyz coordinate format"
-        xyz_out.write(str(npoints))
-        xyz_out.write("\n")
-        xyz_out.write(comment)
-        xyz_out.write("\n")
+        # build the file contents up front and write them in one go
+        lines = [str(npoints), comment]
 
         for leaf in do_leaflet:
-            cx=0
-            for x in self.leaf_grid[leaf].x_centers:
-                cy=0
-                for y in self.leaf_grid[leaf].y_centers:
-                    #get the z coordinate
-                    z = self.leaf_grid[leaf].get_z_at(cx,cy)
-                    ic = self.leaf_grid[leaf].get_index_at(cx,cy)
-                    #optionally pull z value from lipid index dictionary
-                    if zvalue_dict is not 'Default':
-                        z = zvalue_dict[ic]
-                    #get the lipid resname
-
-                    oname = self.frame.lipidcom[ic].type
-                    #write to file
-
-
-                    line = str(oname)+" "+str(x)+" "+str(y)+" "+str(z)
-
-                    xyz_out.write(line)
-                    xyz_out.write("\n")
-                    cy+=1
-                cx+=1
+            #optionally pull z value from lipid index dictionary
+            if not isinstance(zvalue_dict, str):
+                X, Y, Z, dummy_C = self.get_xyzc(leaflet=leaf,
+                                                 zvalue_dict=zvalue_dict)[leaf]
+            else:
+                X, Y, Z, dummy_C = self.get_xyzc(leaflet=leaf)[leaf]
+            #get the lipid resnames
+            lipid_types = {}
+            for ic in self.leaflets[leaf].get_member_indices():
+                lipid_types[ic] = self.frame.lipidcom[ic].type
+            onames = _map_lipid_values(self.leaf_grid[leaf].lipid_grid.ravel(),
+                                       lipid_types)
+            for oname, x, y, z in zip(onames, X, Y, Z):
+                line = str(oname)+" "+str(x)+" "+str(y)+" "+str(z)
+                lines.append(line)
+        #write to file
+        lines.append("")
+        xyz_out.write("\n".join(lines))
         xyz_out.close()
         return
 
@@ -767,19 +800,15 @@ class LipidGrids(object):
         for leaf in self.leaf_grid.keys():
             nxbins = self.leaf_grid[leaf].x_nbins
             nybins = self.leaf_grid[leaf].y_nbins
-            type_array = np.zeros((nxbins, nybins), dtype=np.int)
-            cx=0
-            for dummy_x in self.leaf_grid[leaf].x_centers:
-                cy=0
-                for dummy_y in self.leaf_grid[leaf].y_centers:
-                    #get the z coordinate
-                    ic = self.leaf_grid[leaf].get_index_at(cx,cy)
-                    oname = self.frame.lipidcom[ic].type
-                    itype = group_to_int[oname]
-                    type_array[cx,cy] = itype
-                    cy+=1
-                cx+=1
-            grids_dict[leaf] = np.copy(type_array)
+            type_array = np.zeros((nxbins, nybins), dtype=np.int32)
+            # integer type of each lipid in the leaflet
+            lipid_types = {}
+            for ic in self.leaflets[leaf].get_member_indices():
+                oname = self.frame.lipidcom[ic].type
+                lipid_types[ic] = group_to_int[oname]
+            type_array[:, :] = _map_lipid_values(self.leaf_grid[leaf].lipid_grid,
+                                                 lipid_types)
+            grids_dict[leaf] = type_array
 
         return grids_dict, group_to_int
 
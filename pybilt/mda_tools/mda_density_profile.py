@@ -311,7 +311,7 @@ def partial_charge_density_profile(trajectory,mda_selection, fstart=0,fend=-1,fs
     incr_h = incr/2.0
     centers = np.zeros(nbins)
     nedges = len(edges)
-    for i in xrange(1,nedges):
+    for i in range(1,nedges):
         j=i-1
         centers[j]=edges[j]+incr_h
 
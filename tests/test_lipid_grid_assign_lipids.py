@@ -0,0 +1,83 @@
+from __future__ import print_function
+import numpy as np
+import pybilt.lipid_grid.lipid_grid as lg
+from pybilt.bilayer_analyzer.com_frame import COMFrame, LipidCOM
+from six.moves import range
+
+def test_lipid_grid_assign_lipids():
+    np.random.seed(0)
+    nlipids = 150
+    for box in [(75.0, 75.0), (90.0, 60.0)]:
+        boxx, boxy = box
+        indices = np.arange(nlipids, 2*nlipids)
+        xi = np.random.uniform(0.0, boxx, nlipids)
+        yi = np.random.uniform(0.0, boxy, nlipids)
+        zi = np.random.normal(20.0, 1.0, nlipids)
+        # COMs that sit outside of the box or exactly on its edge
+        xi[0] = -2.5
+        xi[1] = boxx
+        yi[2] = boxy + 1.7
+        yi[3] = -0.5*boxy
+        nxbins = 30
+        nybins = 20
+        x_centers = (np.arange(nxbins) + 0.5)*(boxx/nxbins)
+        y_centers = (np.arange(nybins) + 0.5)*(boxy/nybins)
+        grid_ref, grid_z_ref = _assign_lipids(x_centers, y_centers, xi, yi,
+                                              zi, indices, boxx, boxy)
+        grid = np.zeros((nxbins, nybins), dtype=np.int32)
+        grid_z = np.zeros((nxbins, nybins))
+        lg._assign_lipids(x_centers, y_centers, xi, yi, zi, indices, boxx,
+                          boxy, grid, grid_z)
+        assert np.array_equal(grid, grid_ref)
+        assert np.array_equal(grid_z, grid_z_ref)
+    return
+
+def test_lipid_grid_assign_lipids_empty_leaflet():
+    x_centers = (np.arange(10) + 0.5)*5.0
+    y_centers = (np.arange(8) + 0.5)*5.0
+    grid = np.ones((10, 8), dtype=np.int32)
+    grid_z = np.ones((10, 8))
+    empty = np.array([])
+    lg._assign_lipids(x_centers, y_centers, empty, empty, empty,
+                      np.array([], dtype=np.intp), 50.0, 40.0, grid, grid_z)
+    assert not grid.any()
+    assert not grid_z.any()
+    # a whole leaflet grid built from a frame with no members in it
+    com_frame = COMFrame.__new__(COMFrame)
+    com_frame.box = np.array([50.0, 40.0, 80.0], dtype=np.float32)
+    com_frame.lipidcom = []
+    for i in range(4):
+        lipid = LipidCOM()
+        lipid.com = np.array([10.0*i, 5.0*i, 20.0])
+        lipid.com_unwrap = lipid.com.copy()
+        com_frame.lipidcom.append(lipid)
+    lipid_grid = lg.LipidGrid2d(com_frame, [], [0, 1], nxbins=10, nybins=8)
+    assert lipid_grid.lipid_grid.shape == (10, 8)
+    assert not lipid_grid.lipid_grid.any()
+    assert not lipid_grid.lipid_grid_z.any()
+    return
+
+def _assign_lipids(x_centers, y_centers, xi, yi, zi, indices, boxx, boxy):
+    lipid_grid = np.zeros((len(x_centers), len(y_centers)), dtype=np.int64)
+    lipid_grid_z = np.zeros((len(x_centers), len(y_centers)))
+    for cx in range(len(x_centers)):
+        x = x_centers[cx]
+        for cy in range(len(y_centers)):
+            y = y_centers[cy]
+            r_min = 1.0e10
+            for k in range(len(indices)):
+                dx = np.absolute(x - xi[k]) % boxx
+                dy = np.absolute(y - yi[k]) % boxy
+                dx = min(dx, boxx - dx)
+                dy = min(dy, boxy - dy)
+                rxy = np.sqrt(dx**2 + dy**2)
+                if rxy < r_min:
+                    r_min = rxy
+                    lipid_grid[cx, cy] = indices[k]
+                    lipid_grid_z[cx, cy] = zi[k]
+    return lipid_grid, lipid_grid_z
+
+
+if __name__ == '__main__':
+    test_lipid_grid_assign_lipids()
+    test_lipid_grid_assign_lipids_empty_leaflet()
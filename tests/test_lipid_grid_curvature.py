@@ -4,6 +4,7 @@ from pybilt.plot_generation import plot_generation_functions as pgf
 from pybilt.plot_generation.plot_generation_functions import _color_list
 from scipy.ndimage.filters import gaussian_filter
 from six.moves import range
+import pybilt.lipid_grid.lipid_grid as lg
 def test_lipid_grid_curvature():
     sel_string = "resname POPC DOPE TLCL2"
     name_dict = {'DOPE':['P'],'POPC':['P'],'TLCL2':['P1','P3']}
@@ -38,6 +39,10 @@ def test_lipid_grid_curvature():
     #xyzc_u_mean_i = (x_vals, y_vals, x_vals, curvature_grids_i[0].flatten())
     pgf.plot_grid_as_scatter(xyzc_mean, save=False, show=False, colorbar=True)
     analyzer.reps['lipid_grid'].curvature()
+    # the vectorized version should match the loop based version
+    curvature_grids_lg = lg.grid_curvature(x_vals, y_vals, zgrid_i_f)
+    assert np.allclose(curvature_grids_lg[0], curvature_grids_i[0])
+    assert np.allclose(curvature_grids_lg[1], curvature_grids_i[1])
 
     return
 
@@ -0,0 +1,181 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import numpy as np
+import pybilt.lipid_grid.lipid_grid as lg
+from pybilt.bilayer_analyzer.com_frame import COMFrame, LipidCOM
+from pybilt.bilayer_analyzer.leaflet import Leaflet
+from six.moves import range
+
+def test_lipid_grid_get_xyzc():
+    com_frame, leaflets = _synthetic_frame()
+    grids = lg.LipidGrids(com_frame, leaflets, [0, 1], nxbins=12, nybins=9)
+    nlipids = len(com_frame.lipidcom)
+    zvalues = np.linspace(-1.0, 1.0, nlipids)
+    zvalue_dict = dict(zip(range(nlipids), zvalues))
+    color_dict = np.arange(nlipids)*0.5
+    color_grid = np.random.RandomState(1).uniform(size=(12, 9))
+    color_type_dict = {'POPC': 1.0, 'DOPE': 2.0, 'CHOL': 3.0}
+    options = [{}, {'zvalue_dict': zvalue_dict}, {'zvalue_dict': zvalues},
+               {'color_dict': color_dict}, {'color_grid': color_grid},
+               {'color_type_dict': color_type_dict}]
+    for kwargs in options:
+        both = grids.get_xyzc(leaflet='both', **kwargs)
+        for leaf in ['upper', 'lower']:
+            single = grids.get_xyzc(leaflet=leaf, **kwargs)[leaf]
+            ref = _xyzc_reference(grids, leaf, **kwargs)
+            for value, value_single, value_ref in zip(both[leaf], single,
+                                                      ref):
+                assert np.allclose(value, value_ref)
+                assert np.allclose(value_single, value_ref)
+    # the leaflets get their own arrays
+    both = grids.get_xyzc(leaflet='both')
+    assert not np.allclose(both['upper'][2], both['lower'][2])
+    return
+
+def test_lipid_grid_write_xyz():
+    com_frame, leaflets = _synthetic_frame()
+    grids = lg.LipidGrids(com_frame, leaflets, [0, 1], nxbins=12, nybins=9)
+    nlipids = len(com_frame.lipidcom)
+    zvalues = np.linspace(-1.0, 1.0, nlipids)
+    out_path = tempfile.mkdtemp()
+    try:
+        for zvalue_dict in ['Default', zvalues]:
+            grids.write_xyz(leaflet='both', zvalue_dict=zvalue_dict,
+                            out_path=out_path+os.sep)
+            out_name = os.path.join(out_path, "leaflet_grid_f0_ul.xyz")
+            with open(out_name) as xyz_in:
+                lines = xyz_in.read().splitlines()
+            assert int(lines[0]) == 2*12*9
+            ref_lines = []
+            for leaf in ['upper', 'lower']:
+                if isinstance(zvalue_dict, str):
+                    X, Y, Z, C = _xyzc_reference(grids, leaf)
+                else:
+                    X, Y, Z, C = _xyzc_reference(grids, leaf,
+                                                 zvalue_dict=zvalue_dict)
+                lipid_grid = grids.leaf_grid[leaf].lipid_grid.ravel()
+                for ic, x, y, z in zip(lipid_grid, X, Y, Z):
+                    oname = com_frame.lipidcom[ic].type
+                    ref_lines.append(str(oname)+" "+str(x)+" "+str(y)+" "+str(z))
+            assert lines[2:] == ref_lines
+    finally:
+        shutil.rmtree(out_path)
+    return
+
+def test_lipid_grid_value_maps():
+    com_frame, leaflets = _synthetic_frame()
+    grids = lg.LipidGrids(com_frame, leaflets, [0, 1], nxbins=12, nybins=9)
+    nlipids = len(com_frame.lipidcom)
+    rng = np.random.RandomState(2)
+    values = dict(zip(range(nlipids), rng.uniform(size=nlipids)))
+    vectors = dict(zip(range(nlipids), rng.uniform(size=(nlipids, 3))))
+    maps = grids.map_to_grid(values, leaflet='both')
+    in_grid = rng.uniform(size=(12, 9))
+    type_grids, group_to_int = grids.get_integer_type_arrays()
+    for leaf in ['upper', 'lower']:
+        lipid_grid = grids.leaf_grid[leaf].lipid_grid
+        map_ref = np.zeros((12, 9))
+        vector_ref = np.zeros((12, 9, 3))
+        type_ref = np.zeros((12, 9), dtype=np.int64)
+        dict_ref = {}
+        for cx in range(12):
+            for cy in range(9):
+                ic = lipid_grid[cx, cy]
+                map_ref[cx, cy] = values[ic]
+                vector_ref[cx, cy] = vectors[ic]
+                type_ref[cx, cy] = group_to_int[com_frame.lipidcom[ic].type]
+                dict_ref[ic] = in_grid[cx, cy]
+        assert np.array_equal(maps[leaf], map_ref)
+        assert np.array_equal(grids.map_to_grid(values, leaflet=leaf)[leaf],
+                              map_ref)
+        assert np.array_equal(lg._map_lipid_values(lipid_grid, vectors),
+                              vector_ref)
+        assert grids.grid_to_dict(in_grid, leaflet=leaf) == dict_ref
+        # the type ids are stored in the same int32 type as lipid_grid
+        assert type_grids[leaf].dtype == np.int32
+        assert np.array_equal(type_grids[leaf], type_ref)
+    return
+
+def test_lipid_grid_area_per_lipid():
+    com_frame, leaflets = _synthetic_frame()
+    grids = lg.LipidGrids(com_frame, leaflets, [0, 1], nxbins=12, nybins=9)
+    system_average, average_per_res, area_per_lipid = grids.area_per_lipid()
+    areas = []
+    for leaf in ['upper', 'lower']:
+        leaf_grid = grids.leaf_grid[leaf]
+        area_per_bin = leaf_grid.x_incr*leaf_grid.y_incr
+        leaf_areas = []
+        for i in leaflets[leaf].get_member_indices():
+            area_ref = np.sum(leaf_grid.lipid_grid == i)*area_per_bin
+            assert np.isclose(area_per_lipid[i], area_ref)
+            leaf_areas.append(area_per_lipid[i])
+        # the lipids of each leaflet share the whole grid
+        assert np.isclose(np.sum(leaf_areas), 12*9*area_per_bin)
+        areas.extend(leaf_areas)
+    assert np.isclose(system_average, np.mean(areas))
+    return
+
+def _synthetic_frame(nlipids=60, box=(40.0, 30.0, 80.0), seed=3):
+    # a small two leaflet COMFrame built without an MD trajectory
+    rng = np.random.RandomState(seed)
+    com_frame = COMFrame.__new__(COMFrame)
+    com_frame.box = np.array(box, dtype=np.float32)
+    com_frame.time = 0.0
+    com_frame.mdnumber = 0
+    com_frame.number = 0
+    com_frame.lipidcom = []
+    leaflets = {'upper': Leaflet('upper'), 'lower': Leaflet('lower')}
+    types = {'upper': ['POPC', 'DOPE'], 'lower': ['POPC', 'CHOL']}
+    for i in range(nlipids):
+        if i < nlipids//2:
+            leaf = 'upper'
+            z = 20.0
+        else:
+            leaf = 'lower'
+            z = -20.0
+        lipid = LipidCOM()
+        lipid.type = types[leaf][i % 2]
+        lipid.resid = i + 1
+        lipid.leaflet = leaf
+        lipid.com = np.array([rng.uniform(0.0, box[0]),
+                              rng.uniform(0.0, box[1]),
+                              z + rng.normal()])
+        lipid.com_unwrap = lipid.com + np.array([0.0, 0.0, 0.5])
+        com_frame.lipidcom.append(lipid)
+        leaflets[leaf].add_member(i, lipid.type, lipid.resid)
+    return com_frame, leaflets
+
+def _xyzc_reference(grids, leaf, zvalue_dict=None, color_dict=None,
+                    color_grid=None, color_type_dict=None):
+    leaf_grid = grids.leaf_grid[leaf]
+    X = []
+    Y = []
+    Z = []
+    C = []
+    for cx in range(len(leaf_grid.x_centers)):
+        for cy in range(len(leaf_grid.y_centers)):
+            ic = leaf_grid.get_index_at(cx, cy)
+            z = leaf_grid.get_z_at(cx, cy)
+            if zvalue_dict is not None:
+                z = zvalue_dict[ic]
+            c = 0.0
+            if color_dict is not None:
+                c = color_dict[ic]
+            if color_grid is not None:
+                c = color_grid[cx, cy]
+            if color_type_dict is not None:
+                c = color_type_dict[grids.frame.lipidcom[ic].type]
+            X.append(leaf_grid.x_centers[cx])
+            Y.append(leaf_grid.y_centers[cy])
+            Z.append(z)
+            C.append(c)
+    return np.array(X), np.array(Y), np.array(Z), np.array(C)
+
+
+if __name__ == '__main__':
+    test_lipid_grid_get_xyzc()
+    test_lipid_grid_write_xyz()
+    test_lipid_grid_value_maps()
+    test_lipid_grid_area_per_lipid()